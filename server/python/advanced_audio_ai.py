@@ -5,131 +5,101 @@ import numpy as np
 import pandas as pd
 import seaborn as sns
 import os  # 添加os模块导入
+from functools import lru_cache
 from sklearn.ensemble import RandomForestClassifier, GradientBoostingClassifier
 from sklearn.neural_network import MLPClassifier
 from sklearn.model_selection import train_test_split, cross_val_score
 from sklearn.preprocessing import StandardScaler, LabelEncoder
-from sklearn.metrics import classification_report, confusion_matrix, accuracy_score
+from sklearn.metrics import classification_report, confusion_matrix
 from sklearn.decomposition import PCA
 from sklearn.cluster import KMeans
 import tensorflow as tf
 from tensorflow.keras.models import Sequential
 from tensorflow.keras.layers import Dense, Dropout, LSTM, Conv1D, MaxPooling1D
 from tensorflow.keras.utils import to_categorical
+from joblib import Parallel, delayed
+import audio_features
+from audio_features import get_mel_basis, get_dct
 import warnings
 warnings.filterwarnings('ignore')
 
+@lru_cache(maxsize=None)
+def _torch_gpu_available():
+    """延迟导入torch并检测CUDA，只在准备深度学习数据时调用"""
+    try:
+        import torch
+        import torchaudio  # noqa: F401
+    except ImportError:
+        return False
+    return torch.cuda.is_available()
+
+@lru_cache(maxsize=None)
+def _get_torch_mfcc(sr, n_mfcc, n_fft, n_mels, device):
+    """缓存GPU上的MFCC变换 (参数与librosa默认设置保持一致)"""
+    import torchaudio
+    return torchaudio.transforms.MFCC(
+        sample_rate=sr,
+        n_mfcc=n_mfcc,
+        melkwargs={
+            'n_fft': n_fft,
+            'hop_length': n_fft // 4,
+            'n_mels': n_mels,
+            'pad_mode': 'constant',
+            'mel_scale': 'slaney',
+            'norm': 'slaney',
+        },
+    ).to(device)
+
 class AdvancedAudioAI:
     def __init__(self):
         self.scaler = StandardScaler()
         self.pca = PCA(n_components=20)
         self.label_encoder = LabelEncoder()
         self.models = {
-            'random_forest': RandomForestClassifier(n_estimators=200, random_state=42),
+            'random_forest': RandomForestClassifier(n_estimators=200, n_jobs=-1, max_features="sqrt", random_state=42),
             'gradient_boosting': GradientBoostingClassifier(n_estimators=100, random_state=42),
             'neural_network': MLPClassifier(hidden_layer_sizes=(100, 50), max_iter=500, random_state=42)
         }
         self.deep_model = None
         self.feature_names = []
         
-    def extract_advanced_features(self, audio_path):
-        """提取高级音频特征"""
-        print(f"🔍 正在提取高级特征: {audio_path}")
-        
-        audio, sr = librosa.load(audio_path)
-        
-        features = {}
-        
-        # 1. 基础特征
-        features['duration'] = librosa.get_duration(y=audio, sr=sr)
-        features['sample_rate'] = sr
-        features['n_samples'] = len(audio)
-        
-        # 2. 频谱特征
-        # 梅尔频谱图
-        mel_spec = librosa.feature.melspectrogram(y=audio, sr=sr, n_mels=128)
-        features['mel_spectrogram_mean'] = np.mean(mel_spec)
-        features['mel_spectrogram_std'] = np.std(mel_spec)
-        features['mel_spectrogram_max'] = np.max(mel_spec)
-        features['mel_spectrogram_min'] = np.min(mel_spec)
-        
-        # 3. MFCC特征 (更多系数)
-        mfccs = librosa.feature.mfcc(y=audio, sr=sr, n_mfcc=20)
-        for i in range(20):
-            features[f'mfcc_{i}_mean'] = np.mean(mfccs[i])
-            features[f'mfcc_{i}_std'] = np.std(mfccs[i])
-            features[f'mfcc_{i}_max'] = np.max(mfccs[i])
-            features[f'mfcc_{i}_min'] = np.min(mfccs[i])
-        
-        # 4. 节奏和节拍特征
-        tempo, beats = librosa.beat.beat_track(y=audio, sr=sr)
-        features['tempo'] = tempo
-        features['beat_count'] = len(beats)
-        features['beat_interval_mean'] = np.mean(np.diff(beats)) if len(beats) > 1 else 0
-        
-        # 5. 音高特征
-        pitches, magnitudes = librosa.piptrack(y=audio, sr=sr)
-        features['pitch_mean'] = np.mean(pitches)
-        features['pitch_std'] = np.std(pitches)
-        features['pitch_max'] = np.max(pitches)
-        features['pitch_min'] = np.min(pitches)
-        
-        # 6. 能量特征
-        rms = librosa.feature.rms(y=audio)
-        features['rms_mean'] = np.mean(rms)
-        features['rms_std'] = np.std(rms)
-        features['rms_max'] = np.max(rms)
-        features['rms_min'] = np.min(rms)
-        
-        # 7. 零交叉率
-        zcr = librosa.feature.zero_crossing_rate(audio)
-        features['zcr_mean'] = np.mean(zcr)
-        features['zcr_std'] = np.std(zcr)
-        features['zcr_max'] = np.max(zcr)
-        
-        # 8. 频谱特征
-        spectral_centroids = librosa.feature.spectral_centroid(y=audio, sr=sr)
-        features['spectral_centroid_mean'] = np.mean(spectral_centroids)
-        features['spectral_centroid_std'] = np.std(spectral_centroids)
-        features['spectral_centroid_max'] = np.max(spectral_centroids)
-        
-        spectral_bandwidth = librosa.feature.spectral_bandwidth(y=audio, sr=sr)
-        features['spectral_bandwidth_mean'] = np.mean(spectral_bandwidth)
-        features['spectral_bandwidth_std'] = np.std(spectral_bandwidth)
-        
-        spectral_rolloff = librosa.feature.spectral_rolloff(y=audio, sr=sr)
-        features['spectral_rolloff_mean'] = np.mean(spectral_rolloff)
-        features['spectral_rolloff_std'] = np.std(spectral_rolloff)
-        
-        # 9. 谐波和打击乐分离
-        harmonic, percussive = librosa.effects.hpss(audio)
-        features['harmonic_ratio'] = np.sum(harmonic**2) / (np.sum(harmonic**2) + np.sum(percussive**2))
-        features['percussive_ratio'] = 1 - features['harmonic_ratio']
-        
-        # 10. 色度特征
-        chroma = librosa.feature.chroma_stft(y=audio, sr=sr)
-        features['chroma_mean'] = np.mean(chroma)
-        features['chroma_std'] = np.std(chroma)
-        
-        # 11. 音调特征
-        tonnetz = librosa.feature.tonnetz(y=harmonic, sr=sr)
-        features['tonnetz_mean'] = np.mean(tonnetz)
-        features['tonnetz_std'] = np.std(tonnetz)
-        
-        # 12. 频谱对比度
-        contrast = librosa.feature.spectral_contrast(y=audio, sr=sr)
-        features['spectral_contrast_mean'] = np.mean(contrast)
-        features['spectral_contrast_std'] = np.std(contrast)
-        
-        # 13. 多普勒特征
-        poly_features = librosa.feature.poly_features(y=audio, sr=sr)
-        features['poly_features_mean'] = np.mean(poly_features)
-        features['poly_features_std'] = np.std(poly_features)
-        
-        return features
+    @staticmethod
+    def extract_advanced_features(audio_path, analysis_duration=60.0):
+        """提取高级音频特征 (实现在audio_features模块中)"""
+        return audio_features.extract_advanced_features(audio_path, analysis_duration)
+    
+    def extract_features_parallel(self, audio_paths, analysis_duration=60.0, n_jobs=-1):
+        """并行提取多个音频文件的特征 (工作进程只导入轻量的audio_features模块)"""
+        return Parallel(n_jobs=n_jobs, backend="loky", batch_size="auto", return_as="generator")(
+            delayed(audio_features.extract_features_safe)(audio_path, analysis_duration)
+            for audio_path in audio_paths
+        )
+    
+    def build_feature_matrix(self, audio_paths, analysis_duration=60.0):
+        """提取特征并逐行写入预分配的float32矩阵，返回矩阵和有效文件的索引"""
+        X = None
+        valid_indices = []
+        
+        for i, (_, names, vector) in enumerate(self.extract_features_parallel(audio_paths, analysis_duration)):
+            if vector is None:
+                continue
+            if X is None:
+                self.feature_names = list(names)
+                X = np.empty((len(audio_paths), len(self.feature_names)), dtype=np.float32)
+            X[len(valid_indices)] = vector
+            valid_indices.append(i)
+        
+        if X is None:
+            return np.empty((0, 0), dtype=np.float32), valid_indices
+        
+        return X[:len(valid_indices)], valid_indices
     
     def create_deep_learning_model(self, input_shape, num_classes):
         """创建深度学习模型"""
+        # 有GPU时启用混合精度训练
+        if tf.config.list_physical_devices('GPU'):
+            tf.keras.mixed_precision.set_global_policy("mixed_float16")
+        
         model = Sequential([
             # 卷积层
             Conv1D(64, 3, activation='relu', input_shape=input_shape),
@@ -149,7 +119,8 @@ class AdvancedAudioAI:
             Dense(128, activation='relu'),
             Dropout(0.3),
             Dense(64, activation='relu'),
-            Dense(num_classes, activation='softmax')
+            # 输出层保持float32以保证softmax数值稳定
+            Dense(num_classes, activation='softmax', dtype='float32')
         ])
         
         model.compile(
@@ -160,68 +131,100 @@ class AdvancedAudioAI:
         
         return model
     
-    def prepare_deep_learning_data(self, audio_paths, labels):
+    def _mfcc_batch_gpu(self, clips, sr, n_mfcc=13, n_frames=1000, n_fft=2048):
+        """在GPU上批量计算MFCC，返回形状为(B, n_frames, n_mfcc)的数组"""
+        import torch
+        import torch.nn.functional as F
+        
+        hop_length = n_fft // 4
+        # 只保留前n_frames帧所需的采样点 (含STFT居中所需的半个窗口)
+        max_samples = (n_frames - 1) * hop_length + n_fft // 2
+        
+        lengths = []
+        padded = []
+        for clip in clips:
+            clip = torch.from_numpy(clip[:max_samples]).to('cuda')
+            lengths.append(clip.shape[0])
+            padded.append(F.pad(clip, (0, max_samples - clip.shape[0])))
+        
+        with torch.no_grad():
+            # 增加通道维度，使top_db下限按每个片段单独计算，而不是整个批次共用一个最大值
+            mfcc_transform = _get_torch_mfcc(sr, n_mfcc, n_fft, 128, 'cuda')
+            mfccs = mfcc_transform(torch.stack(padded).unsqueeze(1)).squeeze(1)[:, :, :n_frames]
+            
+            # 与CPU路径一致: 超出音频实际长度的帧填充为0
+            valid_frames = 1 + torch.tensor(lengths, device='cuda') // hop_length
+            mask = torch.arange(n_frames, device='cuda')[None, :] < valid_frames[:, None]
+            mfccs = mfccs * mask[:, None, :]
+        
+        return mfccs.transpose(1, 2).cpu().numpy()  # 转置以匹配Conv1D输入格式
+    
+    def prepare_deep_learning_data(self, audio_paths, labels, batch_size=32):
         """准备深度学习数据"""
         print("🔄 准备深度学习数据...")
         
-        X_deep = []
-        y_deep = []
+        # MFCC输入对精度不敏感，使用float16存储以减少内存占用
+        X_deep = np.empty((len(audio_paths), 1000, 13), dtype=np.float16)
+        n_valid = 0
+        valid_labels = []
+        batch = []
+        use_gpu = _torch_gpu_available()
+        # 只保留前1000帧所需的采样点 (含STFT居中所需的半个窗口)。
+        # CPU和GPU路径都截取相同长度，power_to_db的top_db参考最大值因此都只取自这一段
+        max_samples = (1000 - 1) * 512 + 2048 // 2
         
-        for audio_path in audio_paths:
+        for audio_path, label in zip(audio_paths, labels):
             try:
-                audio, sr = librosa.load(audio_path, sr=22050)
-                
-                # 提取MFCC特征作为深度学习输入
-                mfccs = librosa.feature.mfcc(y=audio, sr=sr, n_mfcc=13)
-                
-                # 确保所有序列长度一致
-                if mfccs.shape[1] > 1000:
-                    mfccs = mfccs[:, :1000]
-                elif mfccs.shape[1] < 1000:
-                    # 填充到1000
-                    padding = np.zeros((13, 1000 - mfccs.shape[1]))
-                    mfccs = np.hstack([mfccs, padding])
-                
-                X_deep.append(mfccs.T)  # 转置以匹配Conv1D输入格式
-                
+                # 只解码前max_samples个采样点，解码耗时不再随歌曲长度增长
+                audio, sr = librosa.load(audio_path, sr=22050, duration=max_samples / 22050)
             except Exception as e:
                 print(f"⚠️ 跳过文件 {audio_path}: {e}")
                 continue
+            
+            valid_labels.append(label)
+            
+            if use_gpu:
+                # 在GPU上按批次计算MFCC
+                batch.append(audio)
+                n_valid += 1
+                if len(batch) == batch_size:
+                    X_deep[n_valid - len(batch):n_valid] = self._mfcc_batch_gpu(batch, sr)
+                    batch = []
+                continue
+            
+            # 提取MFCC特征作为深度学习输入
+            S_power = np.abs(librosa.stft(audio, n_fft=2048, hop_length=512))**2
+            mel_spec = get_mel_basis(sr, 2048, 128) @ S_power
+            mfccs = get_dct(13, 128) @ librosa.power_to_db(mel_spec)
+            
+            # 确保所有序列长度一致，不足1000帧的部分填充为0 (写入时转换为float16)
+            n_frames = min(mfccs.shape[1], 1000)
+            X_deep[n_valid, :n_frames] = mfccs[:, :n_frames].T  # 转置以匹配Conv1D输入格式
+            X_deep[n_valid, n_frames:] = 0
+            n_valid += 1
+        
+        if batch:
+            X_deep[n_valid - len(batch):n_valid] = self._mfcc_batch_gpu(batch, 22050)
         
         # 编码标签
-        y_encoded = self.label_encoder.fit_transform(labels[:len(X_deep)])
+        y_encoded = self.label_encoder.fit_transform(valid_labels)
         y_categorical = to_categorical(y_encoded)
         
-        return np.array(X_deep), y_categorical
+        return X_deep[:n_valid], y_categorical
     
     def train_models(self, audio_paths, labels):
         """训练多个AI模型"""
         print("🤖 开始训练AI模型...")
         
         # 提取特征
-        features_list = []
-        valid_labels = []
-        
-        for i, audio_path in enumerate(audio_paths):
-            try:
-                features = self.extract_advanced_features(audio_path)
-                features_list.append(features)
-                valid_labels.append(labels[i])
-            except Exception as e:
-                print(f"⚠️ 跳过文件 {audio_path}: {e}")
-                continue
+        X, valid_indices = self.build_feature_matrix(audio_paths)
         
-        if len(features_list) < 2:
+        if len(valid_indices) < 2:
             print("❌ 有效数据不足，无法训练模型")
             return
         
-        # 转换为DataFrame
-        df = pd.DataFrame(features_list)
-        self.feature_names = df.columns.tolist()
-        
         # 准备数据
-        X = df.values
-        y = np.array(valid_labels)
+        y = np.array([labels[i] for i in valid_indices])
         
         # 编码标签
         y_encoded = self.label_encoder.fit_transform(y)
@@ -235,6 +238,13 @@ class AdvancedAudioAI:
         X_train_scaled = self.scaler.fit_transform(X_train)
         X_test_scaled = self.scaler.transform(X_test)
         
+        # 训练集足够大时才为梯度提升启用早停，否则内部的分层验证集划分会失败
+        _, class_counts = np.unique(y_train, return_counts=True)
+        if len(y_train) * 0.1 >= len(class_counts) and class_counts.min() >= 2:
+            self.models['gradient_boosting'].set_params(n_iter_no_change=10, validation_fraction=0.1)
+        else:
+            self.models['gradient_boosting'].set_params(n_iter_no_change=None)
+        
         # 训练传统机器学习模型
         results = {}
         for name, model in self.models.items():
@@ -242,11 +252,9 @@ class AdvancedAudioAI:
             model.fit(X_train_scaled, y_train)
             
             # 评估
-            y_pred = model.predict(X_test_scaled)
-            accuracy = accuracy_score(y_test, y_pred)
+            accuracy = model.score(X_test_scaled, y_test)
             results[name] = {
                 'accuracy': accuracy,
-                'predictions': y_pred,
                 'model': model
             }
             print(f"   {name} 准确率: {accuracy:.3f}")
@@ -289,33 +297,20 @@ class AdvancedAudioAI:
         print("🔍 执行聚类分析...")
         
         # 提取特征
-        features_list = []
-        valid_paths = []
-        
-        for audio_path in audio_paths:
-            try:
-                features = self.extract_advanced_features(audio_path)
-                features_list.append(features)
-                valid_paths.append(audio_path)
-            except Exception as e:
-                print(f"⚠️ 跳过文件 {audio_path}: {e}")
-                continue
+        X, valid_indices = self.build_feature_matrix(audio_paths)
         
-        if len(features_list) < 2:
+        if len(valid_indices) < 2:
             print("❌ 数据不足，无法进行聚类分析")
             return
         
-        # 转换为DataFrame
-        df = pd.DataFrame(features_list)
-        X = df.values
-        
         # 标准化
         X_scaled = self.scaler.fit_transform(X)
         
         # 降维
         # Adjust n_components to be at most the minimum of samples and features
         n_components = min(2, min(X_scaled.shape[0], X_scaled.shape[1]))
-        self.pca = PCA(n_components=n_components)
+        # 只需要前几个主成分，使用随机化SVD代替完整分解
+        self.pca = PCA(n_components=n_components, svd_solver='randomized', random_state=42)
         X_pca = self.pca.fit_transform(X_scaled)
         
         # K-means聚类
@@ -338,7 +333,7 @@ class AdvancedAudioAI:
         feature_importance = np.abs(self.pca.components_[0])
         top_features_idx = np.argsort(feature_importance)[-10:]
         plt.barh(range(10), feature_importance[top_features_idx])
-        plt.yticks(range(10), [df.columns[i] for i in top_features_idx])
+        plt.yticks(range(10), [self.feature_names[i] for i in top_features_idx])
         plt.title('Top 10 Feature Importance')
         plt.xlabel('Importance')
         
@@ -350,8 +345,9 @@ class AdvancedAudioAI:
         plt.xlabel('Cluster')
         plt.ylabel('Count')
         
-        # 特征相关性热图
+        # 特征相关性热图 (仅在此处构建DataFrame)
         plt.subplot(2, 2, 4)
+        df = pd.DataFrame(X, columns=self.feature_names)
         correlation_matrix = df.corr()
         sns.heatmap(correlation_matrix.iloc[:10, :10], annot=True, cmap='coolwarm', center=0)
         plt.title('Feature Correlation Matrix')
@@ -386,9 +382,10 @@ class AdvancedAudioAI:
         print(f"   聚类数量: {len(np.unique(clusters))}")
         
         # 保存结果
+        np.save('advanced_audio_features.npy', features_df.to_numpy(dtype=np.float32))
         features_df['cluster'] = clusters
         features_df.to_csv('advanced_audio_analysis.csv', index=False)
-        print(f"\n💾 分析结果已保存到 advanced_audio_analysis.csv")
+        print(f"\n💾 分析结果已保存到 advanced_audio_analysis.csv (特征矩阵: advanced_audio_features.npy)")
         
         return features_df
 
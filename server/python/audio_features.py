@@ -0,0 +1,143 @@
+"""
+音频特征提取
+只依赖librosa/numpy/scipy，供joblib工作进程导入，避免加载tensorflow、sklearn等重量级模块
+"""
+
+import librosa
+import numpy as np
+import scipy.fft
+from functools import lru_cache
+from threadpoolctl import threadpool_limits
+import warnings
+warnings.filterwarnings('ignore')
+
+@lru_cache(maxsize=None)
+def get_mel_basis(sr, n_fft, n_mels):
+    """缓存梅尔滤波器组，避免每个文件重复构建"""
+    return librosa.filters.mel(sr=sr, n_fft=n_fft, n_mels=n_mels)
+
+@lru_cache(maxsize=None)
+def get_dct(n_mfcc, n_mels):
+    """缓存MFCC使用的DCT矩阵 (与librosa默认的type-2 ortho DCT一致)"""
+    return scipy.fft.dct(np.eye(n_mels), type=2, norm='ortho', axis=0)[:n_mfcc]
+
+def extract_advanced_features(audio_path, analysis_duration=60.0):
+    """提取高级音频特征 (只分析前analysis_duration秒，统计特征在此之后基本稳定)"""
+    print(f"🔍 正在提取高级特征: {audio_path}")
+
+    audio, sr = librosa.load(audio_path, sr=22050, duration=analysis_duration, mono=True)
+
+    features = {}
+
+    # 1. 基础特征
+    # 时长取自文件元数据，不受截取影响
+    features['duration'] = librosa.get_duration(path=audio_path)
+    features['sample_rate'] = sr
+    features['n_samples'] = int(round(features['duration'] * sr))  # 与duration保持一致，按完整文件计算
+
+    # 只计算一次STFT，后续频谱特征都复用该结果
+    stft = librosa.stft(audio, n_fft=2048, hop_length=512)
+    S_mag = np.abs(stft)
+    S_power = S_mag**2
+
+    # 2. 频谱特征
+    # 梅尔频谱图
+    mel_spec = get_mel_basis(sr, 2048, 128) @ S_power
+    features['mel_spectrogram_mean'] = np.mean(mel_spec)
+    features['mel_spectrogram_std'] = np.std(mel_spec)
+    features['mel_spectrogram_max'] = np.max(mel_spec)
+    features['mel_spectrogram_min'] = np.min(mel_spec)
+
+    # 3. MFCC特征 (更多系数)
+    mfccs = get_dct(20, 128) @ librosa.power_to_db(mel_spec)
+    for i in range(20):
+        features[f'mfcc_{i}_mean'] = np.mean(mfccs[i])
+        features[f'mfcc_{i}_std'] = np.std(mfccs[i])
+        features[f'mfcc_{i}_max'] = np.max(mfccs[i])
+        features[f'mfcc_{i}_min'] = np.min(mfccs[i])
+
+    # 4. 节奏和节拍特征
+    tempo, beats = librosa.beat.beat_track(y=audio, sr=sr)
+    features['tempo'] = float(np.atleast_1d(tempo)[0])  # 新版librosa返回长度为1的数组
+    features['beat_count'] = len(beats)
+    features['beat_interval_mean'] = np.mean(np.diff(beats)) if len(beats) > 1 else 0
+
+    # 5. 音高特征
+    # 使用YIN得到一维基频曲线，避免piptrack生成庞大的(频点 x 帧)矩阵
+    f0 = librosa.yin(audio, fmin=50, fmax=2000, sr=sr, frame_length=2048)
+    features['pitch_mean'] = np.mean(f0)
+    features['pitch_std'] = np.std(f0)
+    features['pitch_max'] = np.max(f0)
+    features['pitch_min'] = np.min(f0)
+
+    # 6. 能量特征
+    rms = librosa.feature.rms(y=audio)
+    features['rms_mean'] = np.mean(rms)
+    features['rms_std'] = np.std(rms)
+    features['rms_max'] = np.max(rms)
+    features['rms_min'] = np.min(rms)
+
+    # 7. 零交叉率
+    zcr = librosa.feature.zero_crossing_rate(audio)
+    features['zcr_mean'] = np.mean(zcr)
+    features['zcr_std'] = np.std(zcr)
+    features['zcr_max'] = np.max(zcr)
+
+    # 8. 频谱特征
+    spectral_centroids = librosa.feature.spectral_centroid(S=S_mag, sr=sr)
+    features['spectral_centroid_mean'] = np.mean(spectral_centroids)
+    features['spectral_centroid_std'] = np.std(spectral_centroids)
+    features['spectral_centroid_max'] = np.max(spectral_centroids)
+
+    spectral_bandwidth = librosa.feature.spectral_bandwidth(S=S_mag, sr=sr)
+    features['spectral_bandwidth_mean'] = np.mean(spectral_bandwidth)
+    features['spectral_bandwidth_std'] = np.std(spectral_bandwidth)
+
+    spectral_rolloff = librosa.feature.spectral_rolloff(S=S_mag, sr=sr)
+    features['spectral_rolloff_mean'] = np.mean(spectral_rolloff)
+    features['spectral_rolloff_std'] = np.std(spectral_rolloff)
+
+    # 9. 谐波和打击乐分离
+    # 直接在频谱域计算能量 (Parseval定理)，无需逆变换回时域
+    H, P = librosa.decompose.hpss(stft)
+    H_power = np.abs(H)**2
+    harmonic_energy = np.sum(H_power)
+    percussive_energy = np.sum(np.abs(P)**2)
+    features['harmonic_ratio'] = harmonic_energy / (harmonic_energy + percussive_energy)
+    features['percussive_ratio'] = 1 - features['harmonic_ratio']
+
+    # 10. 色度特征
+    chroma = librosa.feature.chroma_stft(S=S_power, sr=sr)
+    features['chroma_mean'] = np.mean(chroma)
+    features['chroma_std'] = np.std(chroma)
+
+    # 11. 音调特征
+    # 使用谐波频谱的STFT色度近似，避免对谐波信号再计算一次CQT
+    tonnetz = librosa.feature.tonnetz(chroma=librosa.feature.chroma_stft(S=H_power, sr=sr), sr=sr)
+    features['tonnetz_mean'] = np.mean(tonnetz)
+    features['tonnetz_std'] = np.std(tonnetz)
+
+    # 12. 频谱对比度
+    contrast = librosa.feature.spectral_contrast(S=S_mag, sr=sr)
+    features['spectral_contrast_mean'] = np.mean(contrast)
+    features['spectral_contrast_std'] = np.std(contrast)
+
+    # 13. 多普勒特征
+    poly_features = librosa.feature.poly_features(S=S_mag, sr=sr)
+    features['poly_features_mean'] = np.mean(poly_features)
+    features['poly_features_std'] = np.std(poly_features)
+
+    return features
+
+def extract_features_safe(audio_path, analysis_duration=60.0):
+    """在工作进程中提取特征并转换为float32向量，失败时返回None"""
+    # 限制每个工作进程的BLAS线程数，避免与joblib进程争抢CPU
+    with threadpool_limits(limits=1):
+        try:
+            features = extract_advanced_features(audio_path, analysis_duration)
+            # 特征名称顺序在所有文件间固定，主进程只需按行写入矩阵
+            vector = np.fromiter(features.values(), dtype=np.float32, count=len(features))
+            return audio_path, tuple(features.keys()), vector
+        except Exception as e:
+            print(f"⚠️ 跳过文件 {audio_path}: {e}")
+            return audio_path, None, None
@@ -10,7 +10,6 @@ import os
 import sys
 import subprocess
 import time
-import random
 from datetime import datetime
 import argparse
 import warnings
@@ -32,6 +31,56 @@ except ImportError as e:
     print("将使用基础音频处理方法")
     LIBROSA_AVAILABLE = False
 
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+try:
+    from numba import njit, prange
+    NUMBA_AVAILABLE = True
+except ImportError:
+    print("⚠️ Numba不可用，将使用NumPy计算波形")
+    NUMBA_AVAILABLE = False
+
+
+def _resample16_numpy(audio, starts, window_size, out_bins, out_overall):
+    """计算每个窗口的整体振幅和16段平均振幅（NumPy实现）"""
+    # 末尾补零，保证最后一个窗口长度完整
+    padded = np.pad(audio, (0, window_size))
+    amplitudes = np.abs(np.lib.stride_tricks.sliding_window_view(padded, window_size)[starts])
+    
+    out_overall[:] = amplitudes.mean(axis=1)
+    
+    chunk_size = window_size // 16
+    out_bins[:] = amplitudes[:, :16 * chunk_size].reshape(len(starts), 16, chunk_size).mean(axis=2)
+
+
+if NUMBA_AVAILABLE:
+    @njit(parallel=True, fastmath=True, cache=True)
+    def _resample16(audio, starts, window_size, out_bins, out_overall):
+        """计算每个窗口的整体振幅和16段平均振幅（Numba实现，无中间数组）"""
+        n_samples = audio.shape[0]
+        chunk_size = window_size // 16
+        for i in prange(starts.shape[0]):
+            s = starts[i]
+            total = 0.0
+            for j in range(16):
+                acc = 0.0
+                for k in range(j * chunk_size, (j + 1) * chunk_size):
+                    if s + k < n_samples:
+                        acc += abs(audio[s + k])
+                out_bins[i, j] = acc / chunk_size
+                total += acc
+            # 16段之外的剩余采样点只计入整体振幅
+            for k in range(16 * chunk_size, window_size):
+                if s + k < n_samples:
+                    total += abs(audio[s + k])
+            out_overall[i] = total / window_size
+else:
+    _resample16 = _resample16_numpy
+
 class AudioProcessor:
     """音频处理类"""
     
@@ -40,22 +89,64 @@ class AudioProcessor:
         self.audio_data = None
         self.sample_rate = 44100
         self.duration = 0
+        self.frame_period = 0.06  # 波形数据相邻两帧之间的实际时间间隔（秒）
         
+    def probe_num_samples(self):
+        """通过ffprobe估算解码后的样本数，失败时返回None"""
+        cmd = [
+            'ffprobe', '-v', 'error',
+            '-show_entries', 'format=duration',
+            '-of', 'default=noprint_wrappers=1:nokey=1',
+            self.audio_path
+        ]
+        try:
+            result = subprocess.run(cmd, capture_output=True, text=True, check=True)
+            duration = float(result.stdout.strip())
+        except (subprocess.CalledProcessError, OSError, ValueError):
+            return None
+        
+        # 多预留1秒，避免时长估算偏小导致缓冲区不足
+        return int(duration * self.sample_rate) + self.sample_rate
+    
     def load_audio_basic(self):
         """使用基础方法加载音频（通过ffmpeg）"""
         try:
-            # 使用ffmpeg提取音频数据
+            # 使用ffmpeg直接输出float32数据，无需再做类型转换
             cmd = [
                 'ffmpeg', '-i', self.audio_path, 
-                '-f', 'f64le', '-acodec', 'pcm_f64le', 
+                '-f', 'f32le', '-acodec', 'pcm_f32le', 
                 '-ar', str(self.sample_rate), '-ac', '1', '-'
             ]
             
-            result = subprocess.run(cmd, capture_output=True, check=True)
+            expected_samples = self.probe_num_samples()
+            # 退出with块时关闭管道并等待ffmpeg结束，出错时先终止进程
+            with subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL) as process:
+                try:
+                    if expected_samples:
+                        # 已知时长时直接读入预分配的缓冲区，避免整段输出再复制一次
+                        buffer = np.empty(expected_samples, dtype=np.float32)
+                        view = memoryview(buffer).cast('B')
+                        n_bytes = 0
+                        while n_bytes < len(view):
+                            n = process.stdout.readinto(view[n_bytes:])
+                            if not n:
+                                break
+                            n_bytes += n
+                        
+                        audio_data = buffer[:n_bytes // 4]
+                        rest = process.stdout.read()
+                        if rest:
+                            audio_data = np.concatenate([audio_data, np.frombuffer(rest, dtype=np.float32)])
+                    else:
+                        audio_data = np.frombuffer(process.stdout.read(), dtype=np.float32)
+                except BaseException:
+                    process.kill()
+                    raise
+            
+            if process.returncode != 0:
+                raise subprocess.CalledProcessError(process.returncode, cmd)
             
-            # 将字节数据转换为numpy数组
-            audio_data = np.frombuffer(result.stdout, dtype=np.float64)
-            self.audio_data = audio_data.astype(np.float32)  # 转换为float32节省内存
+            self.audio_data = audio_data
             self.duration = len(self.audio_data) / self.sample_rate
             
             print(f"✅ 音频加载成功 (基础方法)")
@@ -104,102 +195,73 @@ class AudioProcessor:
         frames_per_second = self.sample_rate / hop_length
         total_frames = int(self.duration * frames_per_second)
         
-        # 存储波形数据，每60ms一次
-        waveform_data = []
-        
         # 计算60ms对应的帧数
-        frames_per_60ms = int(frames_per_second * 0.06)  # 60ms的帧数
+        frames_per_60ms = max(1, int(frames_per_second * 0.06))  # 60ms的帧数
+        # 帧间隔按整数帧取整，实际间隔并不正好是60ms (44.1kHz时约为58ms)
+        self.frame_period = frames_per_60ms * hop_length / self.sample_rate
         
-        for i in range(total_frames):
-            # 计算当前时间窗口
-            start_sample = int(i * hop_length)
-            end_sample = min(start_sample + window_size, len(self.audio_data))
-            
-            if start_sample >= len(self.audio_data):
-                break
-                
-            # 获取当前窗口的音频数据
-            audio_window = self.audio_data[start_sample:end_sample]
-            if len(audio_window) < window_size:
-                audio_window = np.pad(audio_window, (0, window_size - len(audio_window)))
-            
-            # 计算波形振幅（取绝对值的平均）
-            amplitudes = np.abs(audio_window)
-            
-            # 每60ms保存一次数据
-            if i % frames_per_60ms == 0:
-                # 计算整体振幅
-                overall_amplitude = np.mean(amplitudes)
-                
-                # 将波形数据重新采样为16个点
-                resampled = []
-                chunk_size = len(amplitudes) // 16
-                for j in range(16):
-                    start_idx = j * chunk_size
-                    end_idx = (j + 1) * chunk_size
-                    if end_idx > start_idx:
-                        chunk_avg = np.mean(amplitudes[start_idx:end_idx])
-                        resampled.append(chunk_avg)
-                    else:
-                        resampled.append(0)
-                
-                # 归一化到0-1范围
-                max_val = max(resampled) if max(resampled) > 0 else 1
-                normalized = [amp / max_val for amp in resampled]
-                
-                waveform_data.append({
-                    'normalized': normalized,
-                    'overall_amplitude': overall_amplitude
-                })
+        # 只计算每60ms需要保存的帧的起始采样点
+        starts = np.arange(0, total_frames, frames_per_60ms) * hop_length
+        starts = starts[starts < len(self.audio_data)]
+        n_kept = len(starts)
+        
+        # 计算整体振幅，并将波形数据重新采样为16个点
+        resampled = np.empty((n_kept, 16), dtype=np.float32)
+        overall_amplitude = np.empty(n_kept, dtype=np.float32)
+        _resample16(self.audio_data, starts, window_size, resampled, overall_amplitude)
+        
+        # 归一化到0-1范围
+        max_val = resampled.max(axis=1, keepdims=True)
+        # 全静音帧的最大值为0，其16段振幅本身也全为0，跳过除法即保持为0
+        normalized = np.divide(resampled, max_val, out=resampled, where=max_val > 0)
+        
+        # 存储波形数据，每60ms一次
+        waveform_data = [
+            {'normalized': row, 'overall_amplitude': amp}
+            for row, amp in zip(normalized, overall_amplitude)
+        ]
         
         return waveform_data
 
     def waveform_to_pixels(self, waveform_data):
-        """将波形数据转换为LED像素数据"""
-        pixels_data = []
+        """将波形数据转换为LED像素数据，返回形状为(N, 16, 3)的uint8数组"""
+        n_frames = len(waveform_data)
+        if n_frames == 0:
+            return np.zeros((0, 16, 3), dtype=np.uint8)
         
-        for frame in waveform_data:
-            # 获取归一化的振幅数据和整体振幅
-            normalized = frame['normalized']
-            overall_amplitude = frame['overall_amplitude']
-            
-            # 根据整体振幅确定要点亮的LED数量
-            # 归一化整体振幅
-            max_amplitude = np.max([f['overall_amplitude'] for f in waveform_data]) if waveform_data else 1
-            relative_amplitude = overall_amplitude / max_amplitude if max_amplitude > 0 else 0
-            
-            # 计算要点亮的LED数量，范围1-16
-            active_leds = max(1, min(16, int(relative_amplitude * 16) + 1))
-            
-            # 为每一帧创建一组像素
-            frame_pixels = []
-            
-            # 生成一个随机颜色，用于整个帧
-            base_r = random.randint(50, 255)
-            base_g = random.randint(50, 255)
-            base_b = random.randint(50, 255)
-            
-            # 为每个LED设置颜色
-            for i in range(16):
-                if i < active_leds:
-                    # 点亮的LED，亮度随索引递减
-                    brightness_factor = 1.0 - (i / active_leds * 0.7)  # 亮度从100%递减到30%
-                    r = int(base_r * brightness_factor)
-                    g = int(base_g * brightness_factor)
-                    b = int(base_b * brightness_factor)
-                    frame_pixels.append([r, g, b])
-                else:
-                    # 未点亮的LED
-                    frame_pixels.append([0, 0, 0])
-            
-            pixels_data.append(frame_pixels)
+        # 根据整体振幅确定要点亮的LED数量
+        # 归一化整体振幅
+        overall = np.array([f['overall_amplitude'] for f in waveform_data], dtype=np.float32)
+        max_amplitude = overall.max()
+        relative_amplitude = overall / max_amplitude if max_amplitude > 0 else np.zeros_like(overall)
+        
+        # 计算要点亮的LED数量，范围1-16
+        active_leds = np.clip((relative_amplitude * 16).astype(np.int32) + 1, 1, 16)
+        
+        # 为每一帧生成一个随机颜色 (一次性批量生成)
+        rng = np.random.default_rng()
+        base = rng.integers(50, 256, size=(n_frames, 3), dtype=np.uint16)
+        
+        # 点亮的LED亮度随索引递减，从100%递减到30%；未点亮的LED为0
+        idx = np.arange(16)[None, :]
+        mask = idx < active_leds[:, None]
+        brightness = np.where(mask, 1.0 - (idx / active_leds[:, None]) * 0.7, 0.0)
+        
+        pixels_data = (brightness[:, :, None] * base[:, None, :]).astype(np.uint8)
         
         return pixels_data
 
     def save_pixels_data(self, pixels_data, output_file):
-        """将像素数据保存到JSON文件"""
-        with open(output_file, 'w') as f:
-            json.dump(pixels_data, f)
+        """将像素数据保存到JSON文件，扩展名为.npy时保存为NumPy二进制文件"""
+        if output_file.endswith('.npy'):
+            # 每个像素仅占3字节，几乎没有序列化开销
+            np.save(output_file, pixels_data.astype(np.uint8, copy=False))
+        elif ORJSON_AVAILABLE:
+            with open(output_file, 'wb') as f:
+                f.write(orjson.dumps(pixels_data, option=orjson.OPT_SERIALIZE_NUMPY))
+        else:
+            with open(output_file, 'w') as f:
+                json.dump(pixels_data.tolist(), f)
         print(f"✅ 像素数据已保存到 {output_file}")
 
 class LEDController:
@@ -225,7 +287,14 @@ class LEDController:
             return False
         
         try:
-            self.spi.write(pixels)
+            if isinstance(pixels, np.ndarray):
+                # SPIws2812.write只支持列表的补齐/截断，数组需按LED数量补零或截断后再写入
+                frame = np.zeros((self.num_leds, 3), dtype=np.uint8)
+                n = min(self.num_leds, len(pixels))
+                frame[:n] = pixels[:n]
+                self.spi.write_array(frame.ravel())
+            else:
+                self.spi.write(pixels)
             return True
         except Exception as e:
             print(f"❌ LED显示失败: {e}")
@@ -253,7 +322,7 @@ def main():
     parser = argparse.ArgumentParser(description='音频可视化与WS2812 LED控制')
     parser.add_argument('audio_file', help='音频文件路径')
     parser.add_argument('--analyze-only', action='store_true', help='仅分析音频，不播放')
-    parser.add_argument('--output', default='pixels_data.json', help='像素数据输出文件')
+    parser.add_argument('--output', default='pixels_data.json', help='像素数据输出文件 (.json 或 .npy)')
     parser.add_argument('--num-leds', type=int, default=16, help='LED数量')
     
     args = parser.parse_args()
@@ -302,14 +371,24 @@ def main():
     
             # 显示LED灯效
     try:
-        frame_duration = 0.06  # 每60ms更新一次
-        for frame in pixels_data:
-            led_controller.display_frame(frame)
-            time.sleep(frame_duration)
-            
+        # 按波形数据的实际帧间隔更新，而不是固定的60ms
+        frame_duration_ns = int(round(audio_processor.frame_period * 1e9))
+        # 按绝对时间调度每一帧，避免显示耗时累积造成灯光与音频不同步
+        start_ns = time.monotonic_ns()
+        for i, frame in enumerate(pixels_data):
             # 检查音频是否仍在播放
             if audio_process.poll() is not None:
                 break
+            
+            target_ns = start_ns + i * frame_duration_ns
+            now_ns = time.monotonic_ns()
+            if now_ns < target_ns:
+                time.sleep((target_ns - now_ns) / 1e9)
+            elif now_ns - target_ns >= frame_duration_ns:
+                # 落后超过一帧时丢弃该帧，追上音频进度
+                continue
+            
+            led_controller.display_frame(frame)
     except KeyboardInterrupt:
         print("\n⏹️ 用户中断")
     finally: